@@ -1,6 +1,59 @@
+import functools
 import itertools
+import logging
 import random
-import copy
+
+log = logging.getLogger(__name__)
+
+# Row and column offsets of the eight cells surrounding a cell
+NEIGHBOR_OFFSETS = (
+    (-1, -1), (-1, 0), (-1, 1),
+    (0, -1), (0, 1),
+    (1, -1), (1, 0), (1, 1),
+)
+
+
+@functools.lru_cache(maxsize=None)
+def neighbor_lists(height, width):
+    """
+    Returns, for every cell on a height x width board, the list of
+    cells within one row and column of it, not including the cell itself.
+    The list for (i, j) is found at index i * width + j.
+    Results are shared between boards of the same size and must not be modified.
+    """
+    return [
+        [
+            (i + di, j + dj)
+            for di, dj in NEIGHBOR_OFFSETS
+            if 0 <= i + di < height and 0 <= j + dj < width
+        ]
+        for i in range(height)
+        for j in range(width)
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def neighbor_indices(height, width):
+    """
+    Same as neighbor_lists, but with every neighbor given by its
+    flat index i * width + j instead of an (i, j) tuple.
+    """
+    return [
+        [ni * width + nj for ni, nj in neighbors]
+        for neighbors in neighbor_lists(height, width)
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def neighbor_masks(height, width):
+    """
+    Same as neighbor_indices, but with the neighbors of every cell
+    given as one bitmask with bit i * width + j set for each of them.
+    """
+    return [
+        sum(1 << n for n in neighbors)
+        for neighbors in neighbor_indices(height, width)
+    ]
 
 
 class Minesweeper():
@@ -10,26 +63,26 @@ class Minesweeper():
 
     def __init__(self, height=8, width=8, mines=8):
 
+        if not 0 <= mines <= height * width:
+            raise ValueError(f"cannot place {mines} mines on a {height}x{width} board")
+
         # Set initial width, height, and number of mines
         self.height = height
         self.width = width
         self.mines = set()
 
-        # Initialize an empty field with no mines
-        self.board = []
-        for i in range(self.height):
-            row = []
-            for j in range(self.width):
-                row.append(False)
-            self.board.append(row)
+        # Initialize an empty field with no mines, one byte per cell,
+        # with cell (i, j) stored at index i * width + j
+        self.board = bytearray(height * width)
+
+        # Add mines randomly, sampling distinct cells without replacement
+        for index in random.sample(range(height * width), mines):
+            i, j = divmod(index, width)
+            self.mines.add((i, j))
+            self.board[index] = 1
 
-        # Add mines randomly
-        while len(self.mines) != mines:
-            i = random.randrange(height)
-            j = random.randrange(width)
-            if not self.board[i][j]:
-                self.mines.add((i, j))
-                self.board[i][j] = True
+        # Flat indices of the neighbors of every cell, indexed by i * width + j
+        self._neighbors = neighbor_indices(height, width)
 
         # At first, player has found no mines
         self.mines_found = set()
@@ -42,7 +95,7 @@ class Minesweeper():
         for i in range(self.height):
             print("--" * self.width + "-")
             for j in range(self.width):
-                if self.board[i][j]:
+                if self.board[i * self.width + j]:
                     print("|X", end="")
                 else:
                     print("| ", end="")
@@ -51,7 +104,7 @@ class Minesweeper():
 
     def is_mine(self, cell):
         i, j = cell
-        return self.board[i][j]
+        return bool(self.board[i * self.width + j])
 
     def nearby_mines(self, cell):
         """
@@ -60,23 +113,9 @@ class Minesweeper():
         not including the cell itself.
         """
 
-        # Keep count of nearby mines
-        count = 0
-
-        # Loop over all cells within one row and column
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # Update count if cell in bounds and is mine
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    if self.board[i][j]:
-                        count += 1
-
-        return count
+        i, j = cell
+        board = self.board
+        return sum(board[n] for n in self._neighbors[i * self.width + j])
 
     def won(self):
         """
@@ -90,14 +129,77 @@ class Sentence():
     Logical statement about a Minesweeper game
     A sentence consists of a set of board cells,
     and a count of the number of those cells which are mines.
+    The cells may be given as an iterable of (i, j) tuples
+    or as a bitmask with bit i * width + j set for each cell.
     """
 
-    def __init__(self, cells, count):
-        self.cells = set(cells)
+    def __init__(self, cells, count, *, width):
+        # Cells are stored as a bitmask, with bit i * width + j set for (i, j);
+        # a bitmask given as `cells` is used as is
+        self.width = width
+        if isinstance(cells, int):
+            if cells < 0:
+                raise ValueError(f"cell bitmask {cells} is negative")
+            self.mask = cells
+        else:
+            self.mask = 0
+            for cell in cells:
+                bit = self._bit(cell)
+                if not bit:
+                    raise ValueError(f"cell {cell} is not on a board {width} wide")
+                self.mask |= bit
+        self.size = bin(self.mask).count("1")
         self.count = count
+        self._cells = None
+        self._update_status()
+
+    @property
+    def cells(self):
+        """
+        The frozenset of board cells in the sentence, decoded from its bitmask.
+        Use mark_mine and mark_safe to change which cells are in the sentence.
+        """
+        if self._cells is None:
+            cells = []
+            mask = self.mask
+            while mask:
+                bit = mask & -mask
+                cells.append(divmod(bit.bit_length() - 1, self.width))
+                mask ^= bit
+            self._cells = frozenset(cells)
+        return self._cells
+
+    def _bit(self, cell):
+        """
+        Returns the bit of `cell` in the mask, or 0 if the cell
+        is not on a board of the sentence's width.
+        """
+        i, j = cell
+        if i < 0 or not 0 <= j < self.width:
+            return 0
+        return 1 << (i * self.width + j)
+
+    def _update_status(self):
+        """
+        Caches whether the sentence is known to be all safe (1),
+        all mines (2), or neither (0).
+        """
+        if self.count == 0:
+            self._status = 1
+        elif self.count == self.size:
+            self._status = 2
+        else:
+            self._status = 0
+
+    @property
+    def signature(self):
+        """
+        The (mask, count) pair that identifies equal sentences.
+        """
+        return (self.mask, self.count)
 
     def __eq__(self, other):
-        return self.cells == other.cells and self.count == other.count
+        return self.signature == other.signature
 
     def __str__(self):
         return f"{self.cells} = {self.count}"
@@ -106,7 +208,7 @@ class Sentence():
         """
         Returns the set of all cells in self.cells known to be mines.
         """
-        if self.count == len(self.cells):
+        if self._status == 2:
            return self.cells
         return  None 
         # raise NotImplementedErrors
@@ -115,7 +217,7 @@ class Sentence():
         """
         Returns the set of all cells in self.cells known to be safe.
         """
-        if self.count == 0:
+        if self._status == 1:
             return self.cells
         return None
         # raise NotImplementedError
@@ -125,9 +227,13 @@ class Sentence():
         Updates internal knowledge representation given the fact that
         a cell is known to be a mine.
         """
-        if cell in self.cells:
-            self.cells.remove(cell)
+        bit = self._bit(cell)
+        if self.mask & bit:
+            self.mask ^= bit
+            self.size -= 1
             self.count -= 1
+            self._cells = None
+            self._update_status()
         return
         # raise NotImplementedError
 
@@ -136,8 +242,12 @@ class Sentence():
         Updates internal knowledge representation given the fact that
         a cell is known to be safe.
         """
-        if cell in self.cells:
-            self.cells.remove(cell)
+        bit = self._bit(cell)
+        if self.mask & bit:
+            self.mask ^= bit
+            self.size -= 1
+            self._cells = None
+            self._update_status()
         return 
         # raise NotImplementedError
 
@@ -160,8 +270,37 @@ class MinesweeperAI():
         self.mines = set()
         self.safes = set()
 
-        # List of sentences about the game known to be true
-        self.knowledge = []
+        # The same three sets as bitboards, with bit i * width + j set for (i, j)
+        self._moved_bits = 0
+        self._mine_bits = 0
+        self._safe_bits = 0
+
+        # Cells neither played nor known to be mines, with each cell's
+        # position in the list so it can be swap-removed in constant time
+        self._free_cells = [(i, j) for i in range(height) for j in range(width)]
+        self._free_index = {cell: n for n, cell in enumerate(self._free_cells)}
+
+        # Cells known to be safe that have not been played yet
+        self._safe_unplayed = set()
+
+        # Bitmask of the neighbors of every cell, indexed by i * width + j
+        self._neighbor_masks = neighbor_masks(height, width)
+
+        # Sentences about the game known to be true, keyed by id
+        self.knowledge = {}
+        self._next_id = 0
+
+        # Number of sentences in the knowledge base with each signature
+        self._signatures = {}
+
+        # Ids of the sentences that mention each cell
+        self._cell_index = {}
+
+        # Ids of sentences that may have become empty or duplicated
+        self._stale = set()
+
+        # Ids of sentences changed since they were last inspected
+        self._worklist = []
 
     def mark_mine(self, cell):
         """
@@ -169,17 +308,136 @@ class MinesweeperAI():
         to mark that cell as a mine as well.
         """
         self.mines.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_mine(cell)
+        self._mine_bits |= 1 << (cell[0] * self.width + cell[1])
+        self._discard_free(cell)
+        self._update_sentences(cell, Sentence.mark_mine)
 
     def mark_safe(self, cell):
         """
         Marks a cell as safe, and updates all knowledge
         to mark that cell as safe as well.
         """
+        bit = 1 << (cell[0] * self.width + cell[1])
         self.safes.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_safe(cell)
+        self._safe_bits |= bit
+        if not self._moved_bits & bit:
+            self._safe_unplayed.add(cell)
+        self._update_sentences(cell, Sentence.mark_safe)
+
+    def _update_sentences(self, cell, mark):
+        """
+        Applies `mark` to every sentence mentioning `cell` and queues
+        them for inspection, noting any that end up empty or duplicated.
+        """
+        for sentence_id in self._cell_index.pop(cell, ()):
+            sentence = self.knowledge[sentence_id]
+            self._count_signature(sentence, -1)
+            mark(sentence, cell)
+            if self._count_signature(sentence, 1) > 1 or sentence.size == 0:
+                self._stale.add(sentence_id)
+            self._worklist.append(sentence_id)
+
+    def _discard_free(self, cell):
+        """
+        Removes a cell from the cells available for random moves.
+        """
+        n = self._free_index.pop(cell, None)
+        if n is None:
+            return
+        last = self._free_cells.pop()
+        if n < len(self._free_cells):
+            self._free_cells[n] = last
+            self._free_index[last] = n
+
+    def _count_signature(self, sentence, delta):
+        """
+        Adjusts how many sentences in the knowledge base
+        share the signature of the given sentence, and returns that number.
+        """
+        signature = sentence.signature
+        total = self._signatures.get(signature, 0) + delta
+        if total:
+            self._signatures[signature] = total
+        else:
+            del self._signatures[signature]
+        return total
+
+    def _add_sentence(self, sentence):
+        """
+        Adds a sentence to the knowledge base, unless already known,
+        indexing it by its cells and queueing it for inspection.
+        """
+        # Drop cells that have already been resolved
+        mines = sentence.mask & self._mine_bits
+        if mines or sentence.mask & self._safe_bits:
+            sentence = Sentence(
+                sentence.mask & ~(self._mine_bits | self._safe_bits),
+                sentence.count - bin(mines).count("1"),
+                width=self.width
+            )
+
+        if sentence.size == 0 or sentence.signature in self._signatures:
+            return
+
+        sentence_id = self._next_id
+        self._next_id += 1
+        self.knowledge[sentence_id] = sentence
+        self._count_signature(sentence, 1)
+        for cell in sentence.cells:
+            self._cell_index.setdefault(cell, set()).add(sentence_id)
+        self._worklist.append(sentence_id)
+
+    def _remove_sentence(self, sentence_id):
+        """
+        Removes a sentence from the knowledge base and its cell index.
+        """
+        sentence = self.knowledge.pop(sentence_id)
+        self._count_signature(sentence, -1)
+        for cell in sentence.cells:
+            sentence_ids = self._cell_index[cell]
+            sentence_ids.discard(sentence_id)
+            if not sentence_ids:
+                del self._cell_index[cell]
+
+    def _prune(self):
+        """
+        Removes sentences that have been emptied, or that have become
+        duplicates of another sentence, since they were added.
+        """
+        for sentence_id in self._stale:
+            sentence = self.knowledge.get(sentence_id)
+            if sentence is None:
+                continue
+            if sentence.size == 0 or self._signatures[sentence.signature] > 1:
+                self._remove_sentence(sentence_id)
+        self._stale.clear()
+
+    def _propagate(self):
+        """
+        Marks the cells of every queued sentence that is known to be all
+        safe or all mines, until no queued sentences remain.
+        Returns the ids of all sentences inspected along the way.
+        """
+        touched = set()
+        while self._worklist:
+            sentence_id = self._worklist.pop()
+            touched.add(sentence_id)
+            sentence = self.knowledge[sentence_id]
+            if not sentence._status:
+                continue
+
+            # Snapshot the cells, as marking removes them from the sentence
+            safecells = sentence.known_safes()
+            if safecells is not None:
+                for safecell in list(safecells):
+                    self.mark_safe(safecell)
+
+            badcells = sentence.known_mines()
+            if badcells is not None:
+                for badcell in list(badcells):
+                    self.mark_mine(badcell)
+
+        return touched
 
     def add_knowledge(self, cell, count):
         """
@@ -198,98 +456,68 @@ class MinesweeperAI():
         """
         # Marking the cell as a move that has been made
         self.moves_made.add(cell)
+        self._moved_bits |= 1 << (cell[0] * self.width + cell[1])
+        self._safe_unplayed.discard(cell)
+        self._discard_free(cell)
         # Marking the cell as safe
         self.mark_safe(cell)
         
         # Getting all the neighbors of the current cell to construct the new statment 
-        neighbors  = set()
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
+        neighbors = self._neighbor_masks[cell[0] * self.width + cell[1]] & ~self._moved_bits
+        self._add_sentence(Sentence(neighbors, count, width=self.width))
 
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-                
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    ncell = (i, j)
-                    if ncell not in self.moves_made:
-                        neighbors.add((i, j))
-        sentence = Sentence(neighbors, count)
-        if sentence not in self.knowledge:
-            self.knowledge.append(sentence)
-
-        # Marking additional cells as safe or as mines
-        # looping over statments in Knowledge Bank and removing statements that are no longer important
-        for sentence in self.knowledge:
-            # Getting all safe cells in a statment and marking as safe
-            safecells = copy.deepcopy(sentence.known_safes())
-            if safecells != None:
-                for safecell in safecells:
-                    self.mark_safe(safecell)
+        # Marking additional cells as safe or as mines, then adding
+        # inferred sentences until nothing new can be concluded
+        touched = self._propagate()
+        while touched:
+            for new_sentence in self._infer(touched):
+                self._add_sentence(new_sentence)
+            touched = self._propagate()
 
-            badcells = copy.deepcopy(sentence.known_mines())
-            if badcells != None:
-                for badcell in badcells:
-                    self.mark_mine(badcell)
-    
+        # Dropping sentences that no longer carry any information
+        self._prune()
 
-            
-        # Adding the final inference 
-        # If statment1 is a subset of statment two then statment3  = st2 - st1  = count2 - count1
+        return 
 
+    def _infer(self, touched):
+        """
+        Returns the sentences that follow from pairing each sentence
+        in `touched` with the sentences it shares a cell with.
+        """
+        # If statment1 is a subset of statment two then statment3  = st2 - st1  = count2 - count1
+        # Only sentences sharing a cell with a changed sentence can pair with it
         new_sentences = []
-        for sentence1 in self.knowledge:
-            # Check if setence 1 is a subset of sentence2
-            for sentence2 in self.knowledge:
-                if sentence1 == sentence2 or len(sentence1.cells) == 0 or len(sentence2.cells) <= len(sentence1.cells):
+        for sentence_id in touched:
+            sentence = self.knowledge[sentence_id]
+            partner_ids = set()
+            for cell in sentence.cells:
+                partner_ids |= self._cell_index.get(cell, set())
+            partner_ids.discard(sentence_id)
+
+            for partner_id in partner_ids:
+                partner = self.knowledge[partner_id]
+                # Only a smaller sentence can be a strict subset of a larger one
+                if sentence.size < partner.size:
+                    sentence1, sentence2 = sentence, partner
+                elif partner.size < sentence.size:
+                    sentence1, sentence2 = partner, sentence
+                else:
                     continue
-                # First we assume that it is indeed a subset
-                v = all(cell in sentence2.cells for cell in sentence1.cells)
-                # if indeed subset get sentence2 - sentence1
-                if v:
-                    uncommmon_cells = set()
-                    for cell in sentence2.cells:
-                        if not cell in sentence1.cells:
-                            uncommmon_cells.add(cell)
-                    if len(uncommmon_cells) != 0:
-                        new_sentence = Sentence(uncommmon_cells, sentence2.count - sentence1.count)
-                        print('Sentence1')
-                        print(sentence1)
-                        print('Sentence2')
-                        print(sentence2)
-                        print("New Sentence from intersection: ")
-                        print(new_sentence)
-                        new_sentences.append(new_sentence)
-
-
-        for s in new_sentences:
-            safecells = copy.deepcopy(s.known_safes())
-            if safecells != None:
-                for safecell in safecells:
-                    self.mark_safe(safecell)
-                break
-            badcells = copy.deepcopy(sentence.known_mines())
-            if badcells != None:
-                for badcell in badcells:
-                    self.mark_mine(badcell)
-                break
-            if s not in self.knowledge:
-                self.knowledge.append(s)
-
-
-        for sentence in self.knowledge:
-            # Getting all safe cells in a statment and marking as safe
-            safecells = copy.deepcopy(sentence.known_safes())
-            if safecells != None:
-                for safecell in safecells:
-                    self.mark_safe(safecell)
-
-            badcells = copy.deepcopy(sentence.known_mines())
-            if badcells != None:
-                for badcell in badcells:
-                    self.mark_mine(badcell)
-
-        return 
+                # Being smaller, sentence1 is a strict subset when it has no cells
+                # outside sentence2; if so get sentence2 - sentence1
+                if not sentence1.mask & ~sentence2.mask:
+                    new_sentence = Sentence(
+                        sentence2.mask & ~sentence1.mask,
+                        sentence2.count - sentence1.count,
+                        width=self.width
+                    )
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("Sentence1: %s", sentence1)
+                        log.debug("Sentence2: %s", sentence2)
+                        log.debug("New Sentence from intersection: %s", new_sentence)
+                    new_sentences.append(new_sentence)
+
+        return new_sentences
 
     def make_safe_move(self):
         """
@@ -300,10 +528,7 @@ class MinesweeperAI():
         This function may use the knowledge in self.mines, self.safes
         and self.moves_made, but should not modify any of those values.
         """
-        for cell in self.safes:
-            if cell not in self.moves_made:
-                return cell
-        return None
+        return next(iter(self._safe_unplayed), None)
         # raise NotImplementedError
 
     def make_random_move(self):
@@ -313,16 +538,10 @@ class MinesweeperAI():
             1) have not already been chosen, and
             2) are not known to be mines
         """
-        print ('Known Mines' , self.mines)
-        cells = []
-        for i in range(self.height):
-            for j in range(self.width):
-                if not ((i, j) in self.moves_made) and not((i,j) in self.mines):
-                    cells.append((i,j))
-
-        if len(cells) != 0:
-            cell = cells[random.randint(0, len(cells)-1)]
-            print(cell)
+        log.debug("Known Mines %s", self.mines)
+        if len(self._free_cells) != 0:
+            cell = random.choice(self._free_cells)
+            log.debug("Random move %s", cell)
             return cell
         return None 
         # raise NotImplementedError
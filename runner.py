@@ -213,7 +213,7 @@ while True:
     # Make move and update AI knowledge
     if move:
         if game.is_mine(move):
-            for s in ai.knowledge:
+            for s in ai.knowledge.values():
                 print(s)
             lost = True
         else: